@@ -9,20 +9,39 @@ Auto-failover: if Server 1 sanbao is unreachable for 3 consecutive
 checks (90s), cloudflared starts on Server 2 automatically.
 Auto-failback: if Server 1 recovers for 3 consecutive checks (90s)
 after cooldown (5min), cloudflared stops and traffic returns.
+
+Synthetic probe: a scripted user journey (page → API → streamed chat)
+runs against the public route every PROBE_INTERVAL; failures alert. In
+normal mode, page/API failures (connection errors, 5xx) also count as
+Server 1 failures for auto-failover; chat, 4xx/429 and stream errors only alert.
+
+Restore drills: daily, the newest backup set is restored into throwaway
+containers and verified against its manifest; RTO history in /drills,
+alerts on failure or RTO regression.
+
+Update delivery: long polling by default, or webhook mode (BOT_MODE=webhook)
+served by the embedded PTB web server with secret-token verification.
+Updates are processed concurrently across chats but strictly in order
+within a chat; pending updates are kept across restarts, not dropped.
 """
 
 import asyncio
+import hashlib
+import html
 import json
 import logging
 import os
+import re
+import shlex
 import subprocess
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -30,6 +49,9 @@ from telegram.ext import (
     ContextTypes,
 )
 
+import restore_drill
+import synthetic_probe
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -50,6 +72,61 @@ SYNC_SSH_USER = os.getenv("SYNC_SSH_USER", "metadmin")
 SYNC_SSH_HOST = os.getenv("SYNC_SSH_HOST", PRIMARY_IP)
 SYNC_SSH_PORT = os.getenv("SYNC_SSH_PORT", "22")
 
+# ── Cluster nodes (fan-out commands: /docker all, /disk all, /logs all) ────
+# host=None → the node the bot runs on; others are reached over SSH.
+NODES: dict[str, dict] = {
+    "Server 1": {"host": SYNC_SSH_HOST, "ip": PRIMARY_IP},
+    "Server 2": {"host": None, "ip": STANDBY_IP},
+}
+FANOUT_TIMEOUT = int(os.getenv("FANOUT_TIMEOUT", "20"))  # per-node, seconds
+# SSH connections are multiplexed over one persistent master per host, so
+# repeated health checks and fan-outs skip the TCP + key exchange handshake.
+SSH_CONTROL_PATH = "/tmp/ssh-mux-%r@%h:%p"
+SSH_CONTROL_PERSIST = 300
+
+# ── Synthetic probe config ─────────────────────────────────────────────────
+PROBE_BASE_URL = os.getenv("PROBE_BASE_URL", "https://sanbao.ai")   # "" disables the probe
+# Session token of a dedicated probe user. Each journey sends one real chat
+# message (720/day at the default interval) — the user's plan must have
+# messagesPerDay = 0 (unlimited), otherwise the chat step hits 429.
+PROBE_SESSION_TOKEN = os.getenv("PROBE_SESSION_TOKEN", "")
+PROBE_AGENT_ID = os.getenv("PROBE_AGENT_ID", "")
+PROBE_INTERVAL = int(os.getenv("PROBE_INTERVAL", "120"))            # seconds between journeys
+PROBE_TIMEOUT = int(os.getenv("PROBE_TIMEOUT", "30"))               # per-step timeout
+PROBE_ALERT_THRESHOLD = 2      # consecutive failed journeys before alerting / path failures before S1 counts as down
+PROBE_SLOW_MS = int(os.getenv("PROBE_SLOW_MS", "15000"))            # whole-journey latency alert
+
+# ── Restore drill config ───────────────────────────────────────────────────
+DRILL_ENABLED = os.getenv("DRILL_ENABLED", "true") == "true"
+DRILL_HOUR_UTC = int(os.getenv("DRILL_HOUR_UTC", "5"))              # after the 03:00 backup
+DRILL_BACKUP_DIR = os.getenv("DRILL_BACKUP_DIR", "/backups/daily")
+DRILL_PG_IMAGE = os.getenv("DRILL_PG_IMAGE", "postgres:16-alpine")
+DRILL_LEEMADB_IMAGE = os.getenv("DRILL_LEEMADB_IMAGE", "")          # e.g. deploy-leemadb; "" = skip boot check
+DRILL_MEMORY = os.getenv("DRILL_MEMORY", "4g")                      # per drill container (docker --memory)
+DRILL_CPUS = os.getenv("DRILL_CPUS", "2")                           # per drill container (docker --cpus)
+DRILL_HISTORY_FILE = "/data/restore_drills.json"
+DRILL_HISTORY_KEEP = 60
+DRILL_RTO_BASELINE_RUNS = 7    # successful drills the RTO baseline (median) is taken from
+DRILL_RTO_REGRESSION = float(os.getenv("DRILL_RTO_REGRESSION", "1.5"))  # alert if RTO > baseline × this
+
+# ── Update delivery config ─────────────────────────────────────────────────
+BOT_MODE = os.getenv("BOT_MODE", "polling")            # "polling" | "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")              # public https base, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Telegram only delivers to HTTPS (ports 443/80/88/8443). Either set
+# WEBHOOK_CERT/WEBHOOK_KEY so the embedded server terminates TLS itself
+# (a self-signed cert is uploaded to Telegram on startup; its CN must match
+# the WEBHOOK_URL host), or leave them empty and put a TLS-terminating proxy
+# (nginx, cloudflared) in front of the plain-HTTP listener.
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT", "")
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY", "")
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token; requests without it
+# are rejected by the web server. Derived from the bot token when not set.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
 # ── Auto-failover config ───────────────────────────────────────────────────
 MONITOR_INTERVAL = 30          # seconds between health checks
 FAILOVER_THRESHOLD = 3         # consecutive failures before auto-failover (90s)
@@ -63,6 +140,25 @@ consecutive_failures = 0
 consecutive_recoveries = 0
 last_switch_time = 0.0         # monotonic timestamp of last failover/failback
 failover_active = False
+failover_cause = ""            # "ssh" | "probe" | "manual" — what triggered the active failover
+manual_failback_notified = False  # "do /failback manually" sent for the current probe failover
+
+# Serializes failover/failback: auto-switches in the monitor loop and
+# operator confirmations must never run docker compose concurrently.
+switch_lock = asyncio.Lock()
+# /sync and /backup run non-blocking; one run of each script at a time
+sync_lock = asyncio.Lock()
+backup_lock = asyncio.Lock()
+
+# ── Restore drill state ────────────────────────────────────────────────────
+drill_lock = asyncio.Lock()    # one drill at a time (schedule vs. /drills run)
+
+# ── Synthetic probe state ──────────────────────────────────────────────────
+last_probe: synthetic_probe.JourneyResult | None = None
+probe_fail_count = 0
+probe_path_fail_count = 0      # consecutive journeys with a path-level failure (feeds failover)
+probe_health_state: bool | None = None
+probe_slow_alerted = False
 
 # ── Server 2 local health state ───────────────────────────────────────────
 ORCHESTRATOR_PORT = os.getenv("ORCHESTRATOR_PORT", "8120")
@@ -120,6 +216,47 @@ def require_auth(func):
     return wrapper
 
 
+# ── Update processing ──────────────────────────────────────────────────────
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently, but one at a time per chat.
+
+    Commands from different chats (and the background monitor) no longer
+    wait for each other, while the order of commands within a chat is
+    preserved — e.g. /failover followed by /status is never reordered.
+    The long-running /sync, /backup, /probe and /drills are registered with
+    block=False: they start in order but finish in the background.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_waiters: dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await coroutine
+            return
+
+        chat_id = chat.id
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_waiters[chat_id] = self._chat_waiters.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self._chat_waiters[chat_id] -= 1
+            if self._chat_waiters[chat_id] == 0:
+                del self._chat_waiters[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
 # ── Helpers ─────────────────────────────────────────────────────────────────
 async def check_url(url: str, timeout: int = 8, any_response: bool = False) -> tuple[bool, str]:
     """Check HTTP endpoint, return (ok, detail).
@@ -153,12 +290,25 @@ def run_shell(cmd: str, timeout: int = 120) -> tuple[int, str]:
         return 1, str(e)
 
 
+def ssh_cmd(host: str, remote: str) -> str:
+    """Build a shell command running `remote` on host over a pooled SSH connection.
+
+    Keepalives make a master stuck on a dead TCP connection exit within ~10s
+    instead of stalling new sessions (and the failover health check) behind it.
+    """
+    return (
+        f"ssh -o ConnectTimeout=5 -o StrictHostKeyChecking=no "
+        f"-o ServerAliveInterval=5 -o ServerAliveCountMax=2 "
+        f"-o ControlMaster=auto -o ControlPath={SSH_CONTROL_PATH} "
+        f"-o ControlPersist={SSH_CONTROL_PERSIST} "
+        f"-p {SYNC_SSH_PORT} {SYNC_SSH_USER}@{host} {shlex.quote(remote)}"
+    )
+
+
 def check_s1_sanbao_sync() -> bool:
     """Check Server 1 sanbao health via SSH (blocking)."""
     rc, _ = run_shell(
-        f'ssh -o ConnectTimeout=5 -o StrictHostKeyChecking=no -p {SYNC_SSH_PORT} '
-        f'{SYNC_SSH_USER}@{SYNC_SSH_HOST} '
-        f'"curl -sf --max-time 5 http://localhost:{SANBAO_PORT}/api/ready"',
+        ssh_cmd(SYNC_SSH_HOST, f"curl -sf --max-time 5 http://localhost:{SANBAO_PORT}/api/ready"),
         timeout=15,
     )
     return rc == 0
@@ -167,14 +317,75 @@ def check_s1_sanbao_sync() -> bool:
 def check_s1_cortex_service(port: str, path: str) -> tuple[bool, str]:
     """Check a Server 1 AI Cortex service via SSH (blocking)."""
     rc, out = run_shell(
-        f'ssh -o ConnectTimeout=5 -o StrictHostKeyChecking=no -p {SYNC_SSH_PORT} '
-        f'{SYNC_SSH_USER}@{SYNC_SSH_HOST} '
-        f'"curl -sf --max-time 5 http://localhost:{port}{path}"',
+        ssh_cmd(SYNC_SSH_HOST, f"curl -sf --max-time 5 http://localhost:{port}{path}"),
         timeout=15,
     )
     return (rc == 0, out[:200] if rc == 0 else "unreachable")
 
 
+# ── Fan-out across nodes ──────────────────────────────────────────────────
+async def run_on_node(node: str, cmd: str, timeout: int = FANOUT_TIMEOUT) -> tuple[int, str]:
+    """Run a shell command on a cluster node (locally or over SSH)."""
+    host = NODES[node]["host"]
+    full_cmd = cmd if host is None else ssh_cmd(host, cmd)
+    try:
+        # run_shell enforces the timeout on the process; wait_for is a backstop
+        return await asyncio.wait_for(
+            asyncio.to_thread(run_shell, full_cmd, timeout), timeout + 5,
+        )
+    except asyncio.TimeoutError:
+        return 1, "Timeout"
+
+
+def render_fanout(title: str, results: dict[str, tuple[int, str, float] | None], max_chars: int = 3600) -> str:
+    """Merge per-node output into one message; pending nodes show as ⏳."""
+    budget = max_chars // len(results)
+    parts = [f"<b>{title}</b>"]
+    for node, res in results.items():
+        ip = NODES[node]["ip"]
+        if res is None:
+            parts.append(f"⏳ <b>{node}</b> ({ip})")
+            continue
+        rc, out, elapsed = res
+        icon = "⏱" if out == "Timeout" else "✅" if rc == 0 else "❌"
+        # Escape first, then trim: escaping grows the text, and the budget
+        # must hold for what is actually sent
+        body = html.escape(out or "(пусто)")
+        if len(body) > budget:
+            # Start the tail on a line boundary so no entity is cut in half
+            tail = body[-budget:]
+            _, sep, rest = tail.partition("\n")
+            # No newline in the slice: its start may be inside an entity
+            body = rest if sep else re.sub(r"^[#\w]*;", "", tail)
+        parts.append(
+            f"{icon} <b>{node}</b> ({ip}) — {elapsed:.1f}с\n"
+            f"<pre>{body}</pre>"
+        )
+    return "\n\n".join(parts)
+
+
+async def fan_out(update: Update, title: str, cmd: str) -> None:
+    """Run cmd on all nodes concurrently, editing one message as results arrive.
+
+    Total latency is that of the slowest node (bounded by FANOUT_TIMEOUT).
+    """
+    results: dict[str, tuple[int, str, float] | None] = {n: None for n in NODES}
+    msg = await update.message.reply_text(render_fanout(title, results), parse_mode="HTML")
+    t0 = time.monotonic()
+
+    async def one(node: str) -> str:
+        rc, out = await run_on_node(node, cmd)
+        results[node] = (rc, out, time.monotonic() - t0)
+        return node
+
+    for done in asyncio.as_completed([one(n) for n in NODES]):
+        await done
+        try:
+            await msg.edit_text(render_fanout(title, results), parse_mode="HTML")
+        except Exception as e:
+            logger.warning("Fan-out message update failed: %s", e)
+
+
 def verify_cloudflared_running(retries: int = 3, wait: int = 5) -> tuple[bool, str]:
     """Verify cloudflared is actually running after docker compose up.
 
@@ -195,28 +406,62 @@ def verify_cloudflared_running(retries: int = 3, wait: int = 5) -> tuple[bool, s
     return False, f"cloudflared not running after {retries * wait}s: {logs[:300]}"
 
 
-def write_state(active: bool, fail_count: int = 0) -> None:
+def write_state(active: bool, fail_count: int = 0, cause: str = "") -> None:
     """Persist failover state to disk."""
     try:
         STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
         STATE_FILE.write_text(
             f"FAILOVER_ACTIVE={'true' if active else 'false'}\n"
             f"FAIL_COUNT={fail_count}\n"
+            f"FAILOVER_CAUSE={cause}\n"
             f"UPDATED={datetime.now(timezone.utc).isoformat()}\n"
         )
     except Exception as e:
         logger.error("Failed to write state file: %s", e)
 
 
-def read_state() -> bool:
-    """Read failover state from disk."""
+def read_state() -> tuple[bool, str]:
+    """Read failover state (active, cause) from disk."""
     try:
         if STATE_FILE.exists():
             content = STATE_FILE.read_text()
-            return "FAILOVER_ACTIVE=true" in content
+            cause = ""
+            for line in content.splitlines():
+                if line.startswith("FAILOVER_CAUSE="):
+                    cause = line.split("=", 1)[1]
+            return "FAILOVER_ACTIVE=true" in content, cause
     except Exception:
         pass
-    return False
+    return False, ""
+
+
+def public_path_ok() -> bool:
+    """Whether the synthetic probe considers the public route to Server 1 healthy.
+
+    Only meaningful in normal mode — during failover the public route points
+    at Server 2. Missing or stale probe results count as healthy so a broken
+    prober never triggers failover on its own. Only path-level failures
+    count (see JourneyResult.path_ok): chat errors and 4xx/429 would follow
+    traffic to Server 2, which shares the provider and the quotas.
+    """
+    if failover_active or last_probe is None:
+        return True
+    if time.monotonic() - last_probe.finished_mono > 3 * PROBE_INTERVAL:
+        return True
+    return probe_path_fail_count < PROBE_ALERT_THRESHOLD
+
+
+def probe_summary() -> str:
+    """One-line summary of the last probe for /status."""
+    if not PROBE_BASE_URL:
+        return "выключена"
+    if last_probe is None:
+        return "?"
+    age = int(time.monotonic() - last_probe.finished_mono)
+    if last_probe.ok:
+        return f"ok {last_probe.total_ms:.0f}ms ({age}с назад)"
+    failed = last_probe.failed_step
+    return f"FAIL на {failed.name if failed else '?'} ({age}с назад)"
 
 
 async def send_telegram_async(message: str) -> None:
@@ -237,16 +482,138 @@ async def send_telegram_async(message: str) -> None:
         logger.error("Telegram notification failed: %s", e)
 
 
+# ── Restore drill history ──────────────────────────────────────────────────
+def load_drills() -> list[dict]:
+    try:
+        with open(DRILL_HISTORY_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def save_drills(drills: list[dict]) -> None:
+    Path(DRILL_HISTORY_FILE).parent.mkdir(parents=True, exist_ok=True)
+    with open(DRILL_HISTORY_FILE, "w") as f:
+        json.dump(drills[-DRILL_HISTORY_KEEP:], f)
+
+
+def rto_baseline(drills: list[dict]) -> float | None:
+    """Median RTO of the last successful drills, or None without history."""
+    recent = [d for d in drills if d.get("ok")][-DRILL_RTO_BASELINE_RUNS:]
+    rtos = sorted(d["rto_s"] for d in recent)
+    if not rtos:
+        return None
+    return rtos[len(rtos) // 2]
+
+
+async def auto_failback() -> None:
+    """Stop cloudflared on Server 2 (Server 1 recovered)."""
+    global failover_active, failover_cause, consecutive_recoveries, last_switch_time, manual_failback_notified
+
+    async with switch_lock:
+        # An operator may have switched while we waited for the lock
+        if not failover_active or failover_cause == "probe" or time.monotonic() - last_switch_time < COOLDOWN_SECONDS:
+            logger.info("Auto-failback skipped: state changed while waiting for switch lock")
+            return
+        # Auto-failback: stop cloudflared, keep sanbao as warm standby
+        logger.info("Auto-failback: Server 1 recovered (%d consecutive OKs)", consecutive_recoveries)
+        rc, out = await asyncio.to_thread(
+            run_shell,
+            f"cd {DEPLOY_DIR} && docker compose -f {COMPOSE_FILE} stop cloudflared 2>&1",
+            60,
+        )
+        if rc == 0:
+            failover_active = False
+            failover_cause = ""
+            consecutive_recoveries = 0
+            manual_failback_notified = False
+            last_switch_time = time.monotonic()
+            write_state(False)
+            logger.info("Auto-failback completed successfully")
+            await send_telegram_async(
+                "✅ <b>Auto-failback выполнен</b>\n\n"
+                f"Server 1 ({PRIMARY_IP}) восстановлен и отвечает "
+                f"{RECOVERY_THRESHOLD} проверок подряд.\n"
+                "Cloudflared на Server 2 остановлен, трафик вернулся на Server 1.\n"
+                "Sanbao на Server 2 продолжает работать как warm standby."
+            )
+        else:
+            logger.error("Auto-failback failed: %s", out)
+            await send_telegram_async(
+                "❌ <b>Auto-failback не удался</b>\n\n"
+                f"<pre>{out[:500]}</pre>"
+            )
+
+
+async def auto_failover(ssh_ok: bool) -> None:
+    """Start cloudflared on Server 2 (Server 1 down or public path broken)."""
+    global failover_active, failover_cause, consecutive_failures, last_switch_time, manual_failback_notified
+
+    async with switch_lock:
+        # An operator may have switched while we waited for the lock
+        if failover_active or time.monotonic() - last_switch_time < COOLDOWN_SECONDS:
+            logger.info("Auto-failover skipped: state changed while waiting for switch lock")
+            return
+        # Auto-failover: start cloudflared on Server 2
+        logger.info("Auto-failover: Server 1 down (%d consecutive failures)", consecutive_failures)
+        rc, out = await asyncio.to_thread(
+            run_shell,
+            f"cd {DEPLOY_DIR} && docker compose -f {COMPOSE_FILE} --profile failover up -d cloudflared 2>&1",
+            120,
+        )
+        if rc == 0:
+            # Verify cloudflared is actually running (not crash-looping)
+            cf_ok, cf_detail = await asyncio.to_thread(verify_cloudflared_running)
+            if cf_ok:
+                failover_active = True
+                failover_cause = "ssh" if not ssh_ok else "probe"
+                consecutive_failures = 0
+                manual_failback_notified = False
+                last_switch_time = time.monotonic()
+                write_state(True, 0, failover_cause)
+                logger.info("Auto-failover completed successfully (cause=%s)", failover_cause)
+                reason = (
+                    f"Server 1 ({PRIMARY_IP}) недоступен"
+                    if failover_cause == "ssh" else
+                    f"Server 1 ({PRIMARY_IP}) отвечает по SSH, но публичный маршрут сломан"
+                )
+                await send_telegram_async(
+                    "⚠️ <b>Auto-failover выполнен</b>\n\n"
+                    f"{reason} "
+                    f"{FAILOVER_THRESHOLD * MONITOR_INTERVAL}с "
+                    f"({FAILOVER_THRESHOLD} проверок подряд).\n"
+                    f"Cloudflared запущен на Server 2 ({STANDBY_IP}), "
+                    "трафик переключён.\n\n"
+                    "Для ручного возврата: /failback"
+                )
+            else:
+                logger.error("Auto-failover: cloudflared started but crashed: %s", cf_detail)
+                await send_telegram_async(
+                    "🔴 <b>Auto-failover: cloudflared не запустился!</b>\n\n"
+                    "docker compose up вернул 0, но контейнер упал.\n"
+                    f"<pre>{cf_detail}</pre>\n\n"
+                    "Требуется ручное вмешательство!"
+                )
+        else:
+            logger.error("Auto-failover failed: %s", out)
+            await send_telegram_async(
+                "🔴 <b>Auto-failover не удался!</b>\n\n"
+                f"Server 1 недоступен, но запуск cloudflared провалился.\n"
+                f"<pre>{out[:500]}</pre>\n\n"
+                "Требуется ручное вмешательство: /failover"
+            )
+
+
 # ── Auto-failover monitoring loop ──────────────────────────────────────────
 async def auto_monitor_loop() -> None:
     """Background loop: check Server 1 health, auto-failover/failback."""
     global consecutive_failures, consecutive_recoveries
-    global last_switch_time, failover_active
+    global last_switch_time, failover_active, failover_cause, manual_failback_notified
 
     # Restore state from disk on startup
-    failover_active = read_state()
+    failover_active, failover_cause = read_state()
     if failover_active:
-        logger.info("Restored failover state: ACTIVE")
+        logger.info("Restored failover state: ACTIVE (cause=%s)", failover_cause or "?")
 
     logger.info(
         "Auto-monitor started: interval=%ds, failover_threshold=%d, "
@@ -258,7 +625,11 @@ async def auto_monitor_loop() -> None:
     while True:
         try:
             # Check Server 1 sanbao health (runs in thread to avoid blocking)
-            s1_ok = await asyncio.to_thread(check_s1_sanbao_sync)
+            ssh_ok = await asyncio.to_thread(check_s1_sanbao_sync)
+            # "Healthy" over SSH is not enough if users can't get through the
+            # public route — the synthetic journey has to pass as well.
+            path_ok = public_path_ok()
+            s1_ok = ssh_ok and path_ok
 
             now = time.monotonic()
             in_cooldown = (now - last_switch_time) < COOLDOWN_SECONDS
@@ -268,33 +639,22 @@ async def auto_monitor_loop() -> None:
                 consecutive_failures = 0
                 consecutive_recoveries += 1
 
-                if failover_active and not in_cooldown:
-                    if consecutive_recoveries >= RECOVERY_THRESHOLD:
-                        # Auto-failback: stop cloudflared, keep sanbao as warm standby
-                        logger.info("Auto-failback: Server 1 recovered (%d consecutive OKs)", consecutive_recoveries)
-                        rc, out = run_shell(
-                            f"cd {DEPLOY_DIR} && docker compose -f {COMPOSE_FILE} stop cloudflared 2>&1",
-                            timeout=60,
+                if failover_active and not in_cooldown and failover_cause == "probe":
+                    # SSH health can't prove the public path to Server 1 is
+                    # fixed; failing back blindly would just flap. Recoveries
+                    # keep counting through the cooldown, so notify once.
+                    if consecutive_recoveries >= RECOVERY_THRESHOLD and not manual_failback_notified:
+                        manual_failback_notified = True
+                        logger.info("Server 1 healthy via SSH, failover was probe-triggered: awaiting manual /failback")
+                        await send_telegram_async(
+                            "ℹ️ <b>Server 1 отвечает по SSH</b>\n\n"
+                            "Failover был вызван синтетической проверкой публичного маршрута, "
+                            "поэтому авто-failback отключён.\n"
+                            "Проверьте маршрут и верните трафик вручную: /failback"
                         )
-                        if rc == 0:
-                            failover_active = False
-                            consecutive_recoveries = 0
-                            last_switch_time = time.monotonic()
-                            write_state(False)
-                            logger.info("Auto-failback completed successfully")
-                            await send_telegram_async(
-                                "✅ <b>Auto-failback выполнен</b>\n\n"
-                                f"Server 1 ({PRIMARY_IP}) восстановлен и отвечает "
-                                f"{RECOVERY_THRESHOLD} проверок подряд.\n"
-                                "Cloudflared на Server 2 остановлен, трафик вернулся на Server 1.\n"
-                                "Sanbao на Server 2 продолжает работать как warm standby."
-                            )
-                        else:
-                            logger.error("Auto-failback failed: %s", out)
-                            await send_telegram_async(
-                                "❌ <b>Auto-failback не удался</b>\n\n"
-                                f"<pre>{out[:500]}</pre>"
-                            )
+                elif failover_active and not in_cooldown:
+                    if consecutive_recoveries >= RECOVERY_THRESHOLD:
+                        await auto_failback()
                 elif failover_active and in_cooldown:
                     remaining = int(COOLDOWN_SECONDS - (now - last_switch_time))
                     if consecutive_recoveries == 1:
@@ -306,48 +666,12 @@ async def auto_monitor_loop() -> None:
 
                 if not failover_active and not in_cooldown:
                     if consecutive_failures >= FAILOVER_THRESHOLD:
-                        # Auto-failover: start cloudflared on Server 2
-                        logger.info("Auto-failover: Server 1 down (%d consecutive failures)", consecutive_failures)
-                        rc, out = run_shell(
-                            f"cd {DEPLOY_DIR} && docker compose -f {COMPOSE_FILE} --profile failover up -d cloudflared 2>&1",
-                            timeout=120,
-                        )
-                        if rc == 0:
-                            # Verify cloudflared is actually running (not crash-looping)
-                            cf_ok, cf_detail = await asyncio.to_thread(verify_cloudflared_running)
-                            if cf_ok:
-                                failover_active = True
-                                consecutive_failures = 0
-                                last_switch_time = time.monotonic()
-                                write_state(True, 0)
-                                logger.info("Auto-failover completed successfully")
-                                await send_telegram_async(
-                                    "⚠️ <b>Auto-failover выполнен</b>\n\n"
-                                    f"Server 1 ({PRIMARY_IP}) недоступен "
-                                    f"{FAILOVER_THRESHOLD * MONITOR_INTERVAL}с "
-                                    f"({FAILOVER_THRESHOLD} проверок подряд).\n"
-                                    f"Cloudflared запущен на Server 2 ({STANDBY_IP}), "
-                                    "трафик переключён.\n\n"
-                                    "Для ручного возврата: /failback"
-                                )
-                            else:
-                                logger.error("Auto-failover: cloudflared started but crashed: %s", cf_detail)
-                                await send_telegram_async(
-                                    "🔴 <b>Auto-failover: cloudflared не запустился!</b>\n\n"
-                                    "docker compose up вернул 0, но контейнер упал.\n"
-                                    f"<pre>{cf_detail}</pre>\n\n"
-                                    "Требуется ручное вмешательство!"
-                                )
-                        else:
-                            logger.error("Auto-failover failed: %s", out)
-                            await send_telegram_async(
-                                "🔴 <b>Auto-failover не удался!</b>\n\n"
-                                f"Server 1 недоступен, но запуск cloudflared провалился.\n"
-                                f"<pre>{out[:500]}</pre>\n\n"
-                                "Требуется ручное вмешательство: /failover"
-                            )
+                        await auto_failover(ssh_ok)
                     elif consecutive_failures == 1:
-                        logger.warning("Server 1 sanbao check failed (1/%d)", FAILOVER_THRESHOLD)
+                        logger.warning(
+                            "Server 1 sanbao check failed (1/%d, ssh_ok=%s, path_ok=%s)",
+                            FAILOVER_THRESHOLD, ssh_ok, path_ok,
+                        )
                 elif not failover_active and in_cooldown:
                     if consecutive_failures == 1:
                         remaining = int(COOLDOWN_SECONDS - (now - last_switch_time))
@@ -450,6 +774,149 @@ async def auto_monitor_loop() -> None:
         await asyncio.sleep(MONITOR_INTERVAL)
 
 
+# ── Synthetic probe loop ───────────────────────────────────────────────────
+async def run_probe() -> synthetic_probe.JourneyResult:
+    return await synthetic_probe.run_journey(
+        PROBE_BASE_URL, PROBE_SESSION_TOKEN, PROBE_AGENT_ID, timeout=PROBE_TIMEOUT,
+    )
+
+
+async def probe_loop() -> None:
+    """Background loop: run the synthetic journey and alert on state changes."""
+    global last_probe, probe_fail_count, probe_path_fail_count, probe_health_state, probe_slow_alerted
+
+    logger.info(
+        "Synthetic probe started: url=%s, interval=%ds, auth=%s",
+        PROBE_BASE_URL, PROBE_INTERVAL, "yes" if PROBE_SESSION_TOKEN else "no",
+    )
+
+    while True:
+        try:
+            result = await run_probe()
+            last_probe = result
+            report = synthetic_probe.format_journey(result)
+            target = "Server 2 (failover)" if failover_active else "Server 1"
+            probe_path_fail_count = 0 if result.path_ok else probe_path_fail_count + 1
+
+            if result.ok:
+                probe_fail_count = 0
+                if probe_health_state is False:
+                    logger.info("Synthetic probe recovered")
+                    await send_telegram_async(
+                        f"✅ <b>Синтетическая проверка снова проходит</b> ({target})\n\n"
+                        f"<pre>{html.escape(report)}</pre>"
+                    )
+                probe_health_state = True
+
+                if result.total_ms > PROBE_SLOW_MS and not probe_slow_alerted:
+                    probe_slow_alerted = True
+                    logger.warning("Synthetic probe slow: %.0fms", result.total_ms)
+                    await send_telegram_async(
+                        f"🐢 <b>Публичный маршрут медленный</b> ({target})\n\n"
+                        f"Путь пользователя занял {result.total_ms:.0f}мс "
+                        f"(порог {PROBE_SLOW_MS}мс).\n<pre>{html.escape(report)}</pre>"
+                    )
+                elif result.total_ms <= PROBE_SLOW_MS:
+                    probe_slow_alerted = False
+            else:
+                probe_fail_count += 1
+                if probe_health_state is not False and probe_fail_count >= PROBE_ALERT_THRESHOLD:
+                    probe_health_state = False
+                    logger.warning("Synthetic probe FAILING: %s", report)
+                    failed = result.failed_step
+                    if not result.path_ok:
+                        impact = "Маршрут/сервер недоступен — учитывается в авто-failover."
+                    elif failed and failed.status == 429:
+                        impact = ("Лимит probe-пользователя исчерпан (429) — нужен тариф "
+                                  "с messagesPerDay = 0. На failover не влияет.")
+                    else:
+                        impact = "Ошибка уровня приложения/LLM — только алерт, на failover не влияет."
+                    await send_telegram_async(
+                        f"🔴 <b>Синтетическая проверка не проходит</b> ({target})\n\n"
+                        f"{probe_fail_count} прогонов подряд "
+                        f"({probe_fail_count * PROBE_INTERVAL}с).\n{impact}\n<pre>{html.escape(report)}</pre>"
+                    )
+        except Exception as e:
+            logger.error("Probe loop error: %s", e)
+
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+# ── Restore drills ─────────────────────────────────────────────────────────
+async def execute_drill() -> dict:
+    """Run one restore drill, record it and alert on failure or RTO regression.
+
+    The caller must hold drill_lock.
+    """
+    result = await asyncio.to_thread(
+        restore_drill.run_drill,
+        DRILL_BACKUP_DIR,
+        pg_image=DRILL_PG_IMAGE,
+        leemadb_image=DRILL_LEEMADB_IMAGE,
+        memory=DRILL_MEMORY,
+        cpus=DRILL_CPUS,
+    )
+    drills = load_drills()
+    baseline = rto_baseline(drills)
+    result["rto_baseline_s"] = baseline
+    drills.append(result)
+    save_drills(drills)
+
+    report = restore_drill.format_drill(result)
+    if not result["ok"]:
+        logger.error("Restore drill FAILED: %s", report)
+        await send_telegram_async(
+            "🔴 <b>Restore drill не прошёл!</b>\n\n"
+            "Последний бекап не удалось восстановить/проверить.\n"
+            f"<pre>{html.escape(report)}</pre>"
+        )
+    elif baseline and result["rto_s"] > baseline * DRILL_RTO_REGRESSION:
+        logger.warning("Restore drill RTO regression: %.0fs vs baseline %.0fs", result["rto_s"], baseline)
+        await send_telegram_async(
+            "🐢 <b>Restore drill: RTO вырос</b>\n\n"
+            f"RTO {result['rto_s']:.0f}с при медиане {baseline:.0f}с "
+            f"(порог ×{DRILL_RTO_REGRESSION}).\n<pre>{html.escape(report)}</pre>"
+        )
+    else:
+        logger.info("Restore drill OK: RTO %.0fs", result["rto_s"])
+    return result
+
+
+async def drill_loop() -> None:
+    """Background loop: run a restore drill every day at DRILL_HOUR_UTC."""
+    logger.info("Restore drills scheduled daily at %02d:00 UTC (%s)", DRILL_HOUR_UTC, DRILL_BACKUP_DIR)
+    while True:
+        now = datetime.now(timezone.utc)
+        next_run = now.replace(hour=DRILL_HOUR_UTC, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        # During failover Server 2 carries all user traffic; a full restore
+        # would compete with it. Retry hourly until traffic is back on Server 1.
+        if failover_active:
+            logger.info("Restore drill postponed: failover active")
+        while failover_active:
+            await asyncio.sleep(3600)
+        try:
+            async with drill_lock:
+                await execute_drill()
+        except Exception as e:
+            logger.error("Drill loop error: %s", e)
+
+
+def drill_line(d: dict) -> str:
+    """One-line summary of a drill for /drills."""
+    parts = [
+        f"{'✅' if d.get('ok') else '❌'} {d['started_at'][5:16].replace('T', ' ')}",
+        f"RTO {d.get('rto_s', 0):.0f}s",
+    ]
+    for name, c in d.get("components", {}).items():
+        parts.append(f"{name[:3]} {c.get('mb_s', 0)}MB/s")
+    if d.get("error"):
+        parts.append(d["error"][:60])
+    return " ".join(parts)
+
+
 # ── Commands ────────────────────────────────────────────────────────────────
 
 HELP_TEXT = """
@@ -461,6 +928,9 @@ HELP_TEXT = """
 /logs    — последние логи синхронизации
 /docker  — статус контейнеров
 /disk    — место на диске
+  (/logs all, /docker all, /disk all — сразу по всем серверам)
+/probe   — синтетическая проверка публичного маршрута
+/drills  — история restore drills (/drills run — запустить)
 /failover — ручной failover
 /failback — вернуть на Server 1
 /help    — эта справка
@@ -469,6 +939,8 @@ HELP_TEXT = """
 Авто-failback через 90с + 5мин cooldown после восстановления.
 <b>Авто-мониторинг S1:</b> AI Cortex (LeemaDB, Orchestrator) — алерт при падении/восстановлении.
 <b>Авто-мониторинг S2:</b> Sanbao, LeemaDB, Orchestrator — алерт при падении/восстановлении.
+<b>Синтетика:</b> страница → API → стрим чата через публичный маршрут; недоступность страницы/API учитывается в авто-failover.
+<b>Restore drills:</b> ежедневное восстановление последнего бекапа с проверкой и замером RTO.
 """
 
 
@@ -497,8 +969,7 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     async def check_via_ssh(port: str, path: str) -> tuple[bool, str]:
         rc, out = await asyncio.to_thread(
             run_shell,
-            f'ssh -o ConnectTimeout=5 -o StrictHostKeyChecking=no -p {SYNC_SSH_PORT} {SYNC_SSH_USER}@{SYNC_SSH_HOST} '
-            f'"curl -sf --max-time 5 http://localhost:{port}{path}"',
+            ssh_cmd(SYNC_SSH_HOST, f"curl -sf --max-time 5 http://localhost:{port}{path}"),
             15,
         )
         return (rc == 0, out[:200] if rc == 0 else "unreachable")
@@ -545,15 +1016,20 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 <b>Режим:</b> {mode}{cooldown_str}
 <b>Мониторинг S1:</b> failures={consecutive_failures}, recoveries={consecutive_recoveries}
 <b>S1 AI Cortex:</b> {', '.join(f'{n}={"ok" if s1_cortex_health_state[n] else "DOWN" if s1_cortex_health_state[n] is False else "?"}' for n in S1_CORTEX_SERVICES)}
-<b>Мониторинг S2:</b> {', '.join(f'{n}={"ok" if s2_health_state[n] else "DOWN" if s2_health_state[n] is False else "?"}' for n in S2_SERVICES)}"""
+<b>Мониторинг S2:</b> {', '.join(f'{n}={"ok" if s2_health_state[n] else "DOWN" if s2_health_state[n] is False else "?"}' for n in S2_SERVICES)}
+<b>Синтетика:</b> {probe_summary()}"""
 
     await msg.edit_text(text, parse_mode="HTML")
 
 
 @require_auth
 async def cmd_sync(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    msg = await update.message.reply_text("🔄 Запускаю синхронизацию...")
-    rc, out = run_shell(f"bash {DEPLOY_DIR}/sync.sh 2>&1", timeout=300)
+    if sync_lock.locked():
+        await update.message.reply_text("⏳ Синхронизация уже выполняется.")
+        return
+    async with sync_lock:
+        msg = await update.message.reply_text("🔄 Запускаю синхронизацию...")
+        rc, out = await asyncio.to_thread(run_shell, f"bash {DEPLOY_DIR}/sync.sh 2>&1", 300)
     icon = "✅" if rc == 0 else "❌"
     await msg.edit_text(
         f"{icon} <b>Синхронизация {'завершена' if rc == 0 else 'ошибка'}</b>\n\n<pre>{out[-1500:]}</pre>",
@@ -563,8 +1039,12 @@ async def cmd_sync(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 @require_auth
 async def cmd_backup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    msg = await update.message.reply_text("💾 Запускаю бекап...")
-    rc, out = run_shell(f"bash {DEPLOY_DIR}/backup.sh 2>&1", timeout=600)
+    if backup_lock.locked():
+        await update.message.reply_text("⏳ Бекап уже выполняется.")
+        return
+    async with backup_lock:
+        msg = await update.message.reply_text("💾 Запускаю бекап...")
+        rc, out = await asyncio.to_thread(run_shell, f"bash {DEPLOY_DIR}/backup.sh 2>&1", 600)
     icon = "✅" if rc == 0 else "❌"
     await msg.edit_text(
         f"{icon} <b>Бекап {'завершён' if rc == 0 else 'ошибка'}</b>\n\n<pre>{out[-1500:]}</pre>",
@@ -572,9 +1052,19 @@ async def cmd_backup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     )
 
 
+def wants_all(context: ContextTypes.DEFAULT_TYPE) -> bool:
+    return bool(context.args) and context.args[0] == "all"
+
+
 @require_auth
 async def cmd_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    rc, out = run_shell("tail -30 /var/log/failover-sync.log 2>/dev/null || echo 'Логов нет'")
+    if wants_all(context):
+        await fan_out(update, "Логи синхронизации (последние 15 строк)",
+                      "tail -15 /var/log/failover-sync.log 2>/dev/null || echo 'Логов нет'")
+        return
+    rc, out = await asyncio.to_thread(
+        run_shell, "tail -30 /var/log/failover-sync.log 2>/dev/null || echo 'Логов нет'",
+    )
     await update.message.reply_text(
         f"<b>Логи синхронизации (последние 30 строк):</b>\n\n<pre>{out[-3000:]}</pre>",
         parse_mode="HTML",
@@ -583,7 +1073,14 @@ async def cmd_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 @require_auth
 async def cmd_docker(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    rc, out = run_shell("docker ps --format 'table {{.Names}}\t{{.Status}}\t{{.Ports}}' 2>&1")
+    if wants_all(context):
+        # Ports dropped to keep both nodes within one message
+        await fan_out(update, "Docker контейнеры",
+                      "docker ps --format '{{.Names}}\t{{.Status}}' 2>&1")
+        return
+    rc, out = await asyncio.to_thread(
+        run_shell, "docker ps --format 'table {{.Names}}\t{{.Status}}\t{{.Ports}}' 2>&1",
+    )
     await update.message.reply_text(
         f"<b>Docker контейнеры:</b>\n\n<pre>{out[-3000:]}</pre>",
         parse_mode="HTML",
@@ -592,13 +1089,70 @@ async def cmd_docker(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
 @require_auth
 async def cmd_disk(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    rc, out = run_shell("df -h / /home 2>&1 && echo '' && du -sh /backups/* 2>/dev/null || echo 'Бекапов нет'")
+    if wants_all(context):
+        await fan_out(update, "Диск",
+                      "df -h / /home 2>&1 && echo '' && du -sh /backups/* 2>/dev/null || echo 'Бекапов нет'")
+        return
+    rc, out = await asyncio.to_thread(
+        run_shell, "df -h / /home 2>&1 && echo '' && du -sh /backups/* 2>/dev/null || echo 'Бекапов нет'",
+    )
     await update.message.reply_text(
         f"<b>Диск:</b>\n\n<pre>{out[-2000:]}</pre>",
         parse_mode="HTML",
     )
 
 
+@require_auth
+async def cmd_probe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not PROBE_BASE_URL:
+        await update.message.reply_text("Синтетическая проверка выключена (PROBE_BASE_URL не задан).")
+        return
+    msg = await update.message.reply_text(f"⏳ Прохожу путь пользователя через {PROBE_BASE_URL}...")
+    result = await run_probe()
+    icon = "✅" if result.ok else "❌"
+    await msg.edit_text(
+        f"{icon} <b>Синтетическая проверка</b>\n\n<pre>{html.escape(synthetic_probe.format_journey(result))}</pre>",
+        parse_mode="HTML",
+    )
+
+
+@require_auth
+async def cmd_drills(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if context.args and context.args[0] == "run":
+        if failover_active:
+            await update.message.reply_text(
+                "⛔ Failover активен: Server 2 обслуживает весь трафик, restore drill не запускаю."
+            )
+            return
+        if drill_lock.locked():
+            await update.message.reply_text("⏳ Restore drill уже выполняется.")
+            return
+        async with drill_lock:
+            msg = await update.message.reply_text("🧪 Запускаю restore drill последнего бекапа...")
+            result = await execute_drill()
+        icon = "✅" if result["ok"] else "❌"
+        await msg.edit_text(
+            f"{icon} <b>Restore drill</b>\n\n<pre>{html.escape(restore_drill.format_drill(result))}</pre>",
+            parse_mode="HTML",
+        )
+        return
+
+    drills = load_drills()
+    if not drills:
+        await update.message.reply_text("Restore drills ещё не запускались. /drills run — запустить.")
+        return
+    baseline = rto_baseline(drills)
+    schedule = f"ежедневно в {DRILL_HOUR_UTC:02d}:00 UTC" if DRILL_ENABLED else "выключены"
+    lines = "\n".join(drill_line(d) for d in reversed(drills[-10:]))
+    await update.message.reply_text(
+        f"<b>Restore drills</b> ({schedule})\n"
+        f"Медиана RTO: {f'{baseline:.0f}с' if baseline else '—'}\n\n"
+        f"<pre>{html.escape(lines)}</pre>\n\n"
+        f"<b>Последний:</b>\n<pre>{html.escape(restore_drill.format_drill(drills[-1]))}</pre>",
+        parse_mode="HTML",
+    )
+
+
 @require_auth
 async def cmd_failover(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     keyboard = InlineKeyboardMarkup([
@@ -630,7 +1184,8 @@ async def cmd_failback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global failover_active, last_switch_time, consecutive_failures, consecutive_recoveries
+    global failover_active, failover_cause, last_switch_time, consecutive_failures, consecutive_recoveries
+    global manual_failback_notified
 
     query = update.callback_query
     if not is_authorized(query.from_user.id):
@@ -644,53 +1199,77 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await query.edit_message_text("Отменено.")
         return
 
-    if data == "confirm_failover":
-        await query.edit_message_text("🔄 Запускаю failover...")
-        rc, out = run_shell(
-            f"cd {DEPLOY_DIR} && docker compose -f {COMPOSE_FILE} --profile failover up -d cloudflared 2>&1",
-            timeout=300,
-        )
-        if rc == 0:
-            # Verify cloudflared is actually running (not crash-looping)
-            cf_ok, cf_detail = await asyncio.to_thread(verify_cloudflared_running)
-            if cf_ok:
-                failover_active = True
-                consecutive_failures = 0
-                consecutive_recoveries = 0
-                last_switch_time = time.monotonic()
-                write_state(True)
-                await query.edit_message_text(
-                    f"✅ <b>Failover выполнен</b>\n\nCloudflared запущен и работает.",
-                    parse_mode="HTML",
-                )
+    if data not in ("confirm_failover", "confirm_failback"):
+        return
+
+    state_before = failover_active
+    if switch_lock.locked():
+        await query.edit_message_text("⏳ Жду завершения текущего переключения...")
+    async with switch_lock:
+        # An auto-switch may have changed the mode while we waited for the lock
+        if failover_active != state_before:
+            mode = "FAILOVER (трафик на Server 2)" if failover_active else "Normal (трафик на Server 1)"
+            await query.edit_message_text(
+                f"ℹ️ Пока шло другое переключение, режим изменился: <b>{mode}</b>.\n"
+                "Проверьте /status и повторите команду при необходимости.",
+                parse_mode="HTML",
+            )
+            return
+
+        if data == "confirm_failover":
+            await query.edit_message_text("🔄 Запускаю failover...")
+            rc, out = await asyncio.to_thread(
+                run_shell,
+                f"cd {DEPLOY_DIR} && docker compose -f {COMPOSE_FILE} --profile failover up -d cloudflared 2>&1",
+                300,
+            )
+            if rc == 0:
+                # Verify cloudflared is actually running (not crash-looping)
+                cf_ok, cf_detail = await asyncio.to_thread(verify_cloudflared_running)
+                if cf_ok:
+                    failover_active = True
+                    failover_cause = "manual"
+                    consecutive_failures = 0
+                    consecutive_recoveries = 0
+                    manual_failback_notified = False
+                    last_switch_time = time.monotonic()
+                    write_state(True, 0, failover_cause)
+                    await query.edit_message_text(
+                        f"✅ <b>Failover выполнен</b>\n\nCloudflared запущен и работает.",
+                        parse_mode="HTML",
+                    )
+                else:
+                    await query.edit_message_text(
+                        f"❌ <b>Failover: cloudflared не запустился</b>\n\n"
+                        f"docker compose up вернул 0, но контейнер упал.\n"
+                        f"<pre>{cf_detail}</pre>",
+                        parse_mode="HTML",
+                    )
             else:
                 await query.edit_message_text(
-                    f"❌ <b>Failover: cloudflared не запустился</b>\n\n"
-                    f"docker compose up вернул 0, но контейнер упал.\n"
-                    f"<pre>{cf_detail}</pre>",
+                    f"❌ <b>Failover ошибка</b>\n\n<pre>{out[-1500:]}</pre>",
                     parse_mode="HTML",
                 )
-        else:
+
+        elif data == "confirm_failback":
+            await query.edit_message_text("🔄 Запускаю failback...")
+            rc, out = await asyncio.to_thread(
+                run_shell, f"bash {DEPLOY_DIR}/failback.sh --skip-sync 2>&1", 300,
+            )
+            if rc == 0:
+                failover_active = False
+                failover_cause = ""
+                consecutive_failures = 0
+                consecutive_recoveries = 0
+                manual_failback_notified = False
+                last_switch_time = time.monotonic()
+                write_state(False)
+            icon = "✅" if rc == 0 else "❌"
             await query.edit_message_text(
-                f"❌ <b>Failover ошибка</b>\n\n<pre>{out[-1500:]}</pre>",
+                f"{icon} <b>Failback {'выполнен' if rc == 0 else 'ошибка'}</b>\n\n<pre>{out[-1500:]}</pre>",
                 parse_mode="HTML",
             )
 
-    elif data == "confirm_failback":
-        await query.edit_message_text("🔄 Запускаю failback...")
-        rc, out = run_shell(f"bash {DEPLOY_DIR}/failback.sh --skip-sync 2>&1", timeout=300)
-        if rc == 0:
-            failover_active = False
-            consecutive_failures = 0
-            consecutive_recoveries = 0
-            last_switch_time = time.monotonic()
-            write_state(False)
-        icon = "✅" if rc == 0 else "❌"
-        await query.edit_message_text(
-            f"{icon} <b>Failback {'выполнен' if rc == 0 else 'ошибка'}</b>\n\n<pre>{out[-1500:]}</pre>",
-            parse_mode="HTML",
-        )
-
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle plain text: password auth or unknown command."""
@@ -716,20 +1295,35 @@ async def post_init(app: Application) -> None:
     """Start background monitoring after bot initialization."""
     asyncio.create_task(auto_monitor_loop())
     logger.info("Background auto-monitor task created")
+    if PROBE_BASE_URL:
+        asyncio.create_task(probe_loop())
+        logger.info("Background synthetic probe task created")
+    if DRILL_ENABLED:
+        asyncio.create_task(drill_loop())
+        logger.info("Background restore drill task created")
 
 
 def main() -> None:
-    logger.info("Starting monitoring bot...")
-    app = Application.builder().token(BOT_TOKEN).build()
+    logger.info("Starting monitoring bot (mode=%s)...", BOT_MODE)
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("help", cmd_help))
     app.add_handler(CommandHandler("status", cmd_status))
-    app.add_handler(CommandHandler("sync", cmd_sync))
-    app.add_handler(CommandHandler("backup", cmd_backup))
     app.add_handler(CommandHandler("logs", cmd_logs))
     app.add_handler(CommandHandler("docker", cmd_docker))
     app.add_handler(CommandHandler("disk", cmd_disk))
+    # Long-running jobs: start in order, then run in the background so
+    # they don't hold the chat's update queue for minutes.
+    app.add_handler(CommandHandler("sync", cmd_sync, block=False))
+    app.add_handler(CommandHandler("backup", cmd_backup, block=False))
+    app.add_handler(CommandHandler("probe", cmd_probe, block=False))
+    app.add_handler(CommandHandler("drills", cmd_drills, block=False))
     app.add_handler(CommandHandler("failover", cmd_failover))
     app.add_handler(CommandHandler("failback", cmd_failback))
     app.add_handler(CallbackQueryHandler(callback_handler))
@@ -738,8 +1332,33 @@ def main() -> None:
     # Register post_init to start the background monitor
     app.post_init = post_init
 
-    logger.info("Bot started with auto-failover monitoring. Waiting for messages...")
-    app.run_polling(drop_pending_updates=True)
+    # Pending updates are kept: commands sent while the bot was restarting
+    # are delivered once it is back instead of being silently dropped.
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL.startswith("https://"):
+            raise SystemExit("BOT_MODE=webhook requires an https:// WEBHOOK_URL")
+        if bool(WEBHOOK_CERT) != bool(WEBHOOK_KEY):
+            raise SystemExit("WEBHOOK_CERT and WEBHOOK_KEY must be set together")
+        logger.info(
+            "Bot started with auto-failover monitoring. Webhook on %s:%d/%s",
+            WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+        )
+        if not WEBHOOK_CERT:
+            logger.info("Webhook listener is plain HTTP; TLS must be terminated by a proxy")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            cert=WEBHOOK_CERT or None,
+            key=WEBHOOK_KEY or None,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=False,
+        )
+    else:
+        logger.info("Bot started with auto-failover monitoring. Waiting for messages...")
+        app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=False)
 
 
 if __name__ == "__main__":
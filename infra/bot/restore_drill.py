@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Restore drills for the daily backups.
+
+Takes the newest manifest-*.json written by backup.sh, streams the matching
+Postgres dump and LeemaDB archive into throwaway containers/volumes, and
+verifies the result against the manifest:
+  - sha256 of each file (computed while streaming, no second read)
+  - exact row count of every table in the dump
+  - file count and total size of the LeemaDB data directory
+  - optionally, that LeemaDB boots on the restored data (/health)
+
+Returns per-component throughput and the total RTO. Blocking — call from a
+worker thread. monitor_bot.py schedules it and keeps the history.
+
+Standalone usage:
+  python restore_drill.py [--backup-dir /backups/daily] [--leemadb-image deploy-leemadb]
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+PG_CONTAINER = "sanbao-restore-drill-pg"
+LDB_CONTAINER = "sanbao-restore-drill-leemadb"
+LDB_VOLUME = "sanbao-restore-drill-leemadb"
+HELPER_IMAGE = "alpine:3"
+CHUNK_SIZE = 1 << 20
+REQUIRED_COMPONENTS = ("postgres", "leemadb")
+MAX_MANIFEST_AGE_H = 26        # daily backups; anything older means backups stopped
+
+
+class DrillError(Exception):
+    """A drill step failed; the message is shown to operators as-is."""
+
+
+def _run(args: list[str], timeout: int = 60, input: str | None = None) -> str:
+    try:
+        r = subprocess.run(args, capture_output=True, text=True, timeout=timeout, input=input)
+    except subprocess.TimeoutExpired:
+        raise DrillError(f"timeout: {' '.join(args[:4])}")
+    if r.returncode != 0:
+        raise DrillError(f"{' '.join(args[:4])}: {(r.stderr or r.stdout).strip()[-300:]}")
+    return r.stdout
+
+
+def _stream_into(path: Path, cmd: list[str], timeout: int) -> tuple[str, int, float]:
+    """Pipe a file into cmd's stdin, hashing it on the way. Returns (sha256, bytes, seconds).
+
+    The deadline covers the write phase too: if cmd stops reading, the
+    blocked write is broken by killing the process.
+    """
+    digest = hashlib.sha256()
+    sent = 0
+    t0 = time.monotonic()
+    # stderr goes to a file: psql notices could otherwise fill the pipe and deadlock
+    with tempfile.TemporaryFile() as err, open(path, "rb") as f:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=err)
+
+        def pump() -> None:
+            nonlocal sent
+            try:
+                while chunk := f.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    proc.stdin.write(chunk)
+                    sent += len(chunk)
+            except (BrokenPipeError, ValueError):
+                pass  # process exited or was killed; rc/timeout below tells which
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        writer = threading.Thread(target=pump, daemon=True)
+        writer.start()
+        writer.join(timeout)
+        try:
+            if writer.is_alive():
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            rc = proc.wait(timeout=max(1.0, timeout - (time.monotonic() - t0)))
+        except subprocess.TimeoutExpired:
+            proc.kill()  # closes the pipe, so a blocked write fails with EPIPE
+            proc.wait()
+            writer.join(10)
+            raise DrillError(f"restore of {path.name} timed out after {timeout}s")
+        if rc != 0:
+            err.seek(0)
+            raise DrillError(f"restore of {path.name} failed: {err.read().decode(errors='replace').strip()[-300:]}")
+    return digest.hexdigest(), sent, time.monotonic() - t0
+
+
+def _throughput(nbytes: int, seconds: float) -> float:
+    return round(nbytes / 1048576 / seconds, 1) if seconds > 0 else 0.0
+
+
+def find_latest_manifest(backup_dir: Path) -> Path | None:
+    manifests = sorted(backup_dir.glob("manifest-*.json"))
+    return manifests[-1] if manifests else None
+
+
+# ── Postgres ──────────────────────────────────────────────────────────────
+def drill_postgres(backup_dir: Path, spec: dict, image: str, timeout: int, limits: list[str]) -> dict:
+    """Restore the dump into a throwaway Postgres and compare row counts."""
+    result: dict = {"ok": False, "file": spec["file"]}
+    _run([
+        "docker", "run", "-d", "--rm", "--name", PG_CONTAINER, *limits,
+        "-e", "POSTGRES_PASSWORD=drill", "-e", "POSTGRES_DB=sanbao", image,
+    ], timeout=120)
+
+    # Over TCP, not the socket: the image's init runs a temporary server with
+    # listen_addresses='' and restarts it, so only the final server is reachable here
+    for _ in range(60):
+        try:
+            _run([
+                "docker", "exec", PG_CONTAINER,
+                "pg_isready", "-h", "127.0.0.1", "-U", "postgres", "-d", "sanbao",
+            ], timeout=10)
+            break
+        except DrillError:
+            time.sleep(1)
+    else:
+        raise DrillError("drill Postgres did not become ready in 60s")
+
+    sha, nbytes, seconds = _stream_into(
+        backup_dir / spec["file"],
+        [
+            "docker", "exec", "-i", "-e", "PGOPTIONS=-c client_min_messages=warning", PG_CONTAINER,
+            "sh", "-c", "gunzip -c | psql -q -v ON_ERROR_STOP=1 -U postgres -d sanbao",
+        ],
+        timeout,
+    )
+    result.update(bytes=nbytes, restore_s=round(seconds, 1), mb_s=_throughput(nbytes, seconds))
+    result["checksum_ok"] = sha == spec["sha256"]
+
+    expected: dict[str, int] = spec.get("rows", {})
+    mismatches: list[str] = []
+    if expected:
+        query = " UNION ALL ".join(
+            f"SELECT '{t.replace(chr(39), chr(39) * 2)}', count(*) FROM {t}" for t in expected
+        )
+        out = _run([
+            "docker", "exec", "-i", PG_CONTAINER,
+            "psql", "-At", "-F", "\t", "-U", "postgres", "-d", "sanbao",
+        ], timeout=600, input=query + ";\n")
+        actual = dict(line.rsplit("\t", 1) for line in out.splitlines() if "\t" in line)
+        for table, rows in expected.items():
+            got = actual.get(table)
+            if got is None or int(got) != rows:
+                mismatches.append(f"{table}: {got} != {rows}")
+    result.update(tables=len(expected), rows=sum(expected.values()), row_mismatches=mismatches[:10])
+
+    result["ok"] = result["checksum_ok"] and not mismatches
+    return result
+
+
+# ── LeemaDB ───────────────────────────────────────────────────────────────
+def drill_leemadb(
+    backup_dir: Path, spec: dict, image: str, timeout: int, boot_timeout: int, limits: list[str],
+) -> dict:
+    """Extract the archive into a throwaway volume, verify it, optionally boot LeemaDB on it."""
+    result: dict = {"ok": False, "file": spec["file"]}
+    _run(["docker", "volume", "create", LDB_VOLUME], timeout=30)
+
+    sha, nbytes, seconds = _stream_into(
+        backup_dir / spec["file"],
+        [
+            "docker", "run", "-i", "--rm", *limits, "-v", f"{LDB_VOLUME}:/data",
+            HELPER_IMAGE, "tar", "xzf", "-", "-C", "/data",
+        ],
+        timeout,
+    )
+    result.update(bytes=nbytes, restore_s=round(seconds, 1), mb_s=_throughput(nbytes, seconds))
+    result["checksum_ok"] = sha == spec["sha256"]
+
+    out = _run([
+        "docker", "run", "--rm", *limits, "-v", f"{LDB_VOLUME}:/data", HELPER_IMAGE, "sh", "-c",
+        "find /data -type f -exec stat -c %s {} + | awk '{ n++; b += $1 } END { printf \"%d %d\", n, b }'",
+    ], timeout=600)
+    files, content_bytes = (int(x) for x in out.split())
+    result.update(files=files, content_bytes=content_bytes)
+    result["contents_ok"] = files == spec.get("files") and content_bytes == spec.get("content_bytes")
+
+    if image:
+        t0 = time.monotonic()
+        data_dir = f"/home/leemadb/data/{spec.get('root', '')}".rstrip("/")
+        _run([
+            "docker", "run", "-d", "--rm", "--name", LDB_CONTAINER, *limits,
+            "-v", f"{LDB_VOLUME}:/home/leemadb/data", image,
+            "--host", "0.0.0.0", "--port", "8080", "--data-dir", data_dir,
+        ], timeout=120)
+        while True:
+            try:
+                _run(["docker", "exec", LDB_CONTAINER, "curl", "-sf", "http://localhost:8080/health"], timeout=10)
+                break
+            except DrillError:
+                if time.monotonic() - t0 > boot_timeout:
+                    raise DrillError(f"drill LeemaDB not healthy after {boot_timeout}s")
+                time.sleep(5)
+        result["boot_s"] = round(time.monotonic() - t0, 1)
+
+    result["ok"] = result["checksum_ok"] and result["contents_ok"]
+    return result
+
+
+def cleanup() -> None:
+    for args in (
+        ["docker", "rm", "-f", PG_CONTAINER, LDB_CONTAINER],
+        ["docker", "volume", "rm", "-f", LDB_VOLUME],
+    ):
+        try:
+            subprocess.run(args, capture_output=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+
+# ── Drill ─────────────────────────────────────────────────────────────────
+def run_drill(
+    backup_dir: str = "/backups/daily",
+    *,
+    pg_image: str = "postgres:16-alpine",
+    leemadb_image: str = "",
+    timeout: int = 3600,
+    leemadb_boot_timeout: int = 900,
+    max_age_hours: float = MAX_MANIFEST_AGE_H,
+    memory: str = "4g",
+    cpus: str = "2",
+) -> dict:
+    """Restore the newest backup set and verify it. Never raises.
+
+    Fails if the set is missing a component or is older than max_age_hours,
+    even when what it does contain restores fine. Drill containers are
+    capped at memory/cpus so they can't starve the services on the host.
+    """
+    started = time.monotonic()
+    limits = ["--memory", memory, "--cpus", cpus]
+    result: dict = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "ok": False,
+        "manifest": None,
+        "components": {},
+        "error": "",
+    }
+    try:
+        cleanup()  # leftovers of an interrupted drill
+        bdir = Path(backup_dir)
+        manifest_path = find_latest_manifest(bdir)
+        if manifest_path is None:
+            raise DrillError(f"no manifest-*.json in {backup_dir}")
+        manifest = json.loads(manifest_path.read_text())
+        result["manifest"] = manifest_path.name
+        age_h = (time.time() - manifest_path.stat().st_mtime) / 3600
+        result["manifest_age_h"] = round(age_h, 1)
+
+        if "postgres" in manifest:
+            result["components"]["postgres"] = drill_postgres(bdir, manifest["postgres"], pg_image, timeout, limits)
+        if "leemadb" in manifest:
+            result["components"]["leemadb"] = drill_leemadb(
+                bdir, manifest["leemadb"], leemadb_image, timeout, leemadb_boot_timeout, limits,
+            )
+
+        problems: list[str] = []
+        missing = [c for c in REQUIRED_COMPONENTS if c not in manifest]
+        if missing:
+            problems.append(f"{manifest_path.name} has no {', '.join(missing)} backup")
+        if age_h > max_age_hours:
+            problems.append(f"newest manifest is {age_h:.0f}h old — backups stopped?")
+        result["error"] = "; ".join(problems)
+        result["ok"] = not problems and all(c["ok"] for c in result["components"].values())
+    except DrillError as e:
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"[:300]
+    finally:
+        cleanup()
+
+    result["rto_s"] = round(time.monotonic() - started, 1)
+    return result
+
+
+def format_drill(result: dict) -> str:
+    """Compact plain-text report of one drill."""
+    head = "OK" if result["ok"] else "FAIL"
+    lines = [f"{head} {result['started_at'][:16]} RTO {result.get('rto_s', 0):.0f}s ({result.get('manifest') or '-'})"]
+    for name, c in result.get("components", {}).items():
+        line = (
+            f"  {'✅' if c['ok'] else '❌'} {name:<8} {c.get('bytes', 0) / 1048576:.0f}MB "
+            f"in {c.get('restore_s', 0):.0f}s ({c.get('mb_s', 0)} MB/s)"
+        )
+        if "boot_s" in c:
+            line += f", boot {c['boot_s']:.0f}s"
+        lines.append(line)
+        if not c.get("checksum_ok", True):
+            lines.append("      sha256 mismatch")
+        if c.get("row_mismatches"):
+            lines.append(f"      rows: {'; '.join(c['row_mismatches'][:3])}")
+        if c.get("contents_ok") is False:
+            lines.append(f"      files/bytes differ: {c.get('files')}/{c.get('content_bytes')}")
+    if result.get("error"):
+        lines.append(f"  {result['error']}")
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backup-dir", default="/backups/daily")
+    parser.add_argument("--pg-image", default="postgres:16-alpine")
+    parser.add_argument("--leemadb-image", default="", help="boot LeemaDB on restored data (skipped if empty)")
+    parser.add_argument("--memory", default="4g", help="memory limit per drill container")
+    parser.add_argument("--cpus", default="2", help="CPU limit per drill container")
+    args = parser.parse_args()
+
+    result = run_drill(
+        args.backup_dir, pg_image=args.pg_image, leemadb_image=args.leemadb_image,
+        memory=args.memory, cpus=args.cpus,
+    )
+    print(format_drill(result))
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
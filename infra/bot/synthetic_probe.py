@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Synthetic user-journey probe for the public Sanbao entry point.
+
+Walks the same path a real user takes through cloudflared:
+  1. page — GET /            (app loads)
+  2. api  — GET /api/agents  (authenticated API call, Bearer session token)
+  3. chat — POST /api/chat   (short streamed completion against a test agent)
+
+Every step records DNS / connect / TTFB / first-token / total time (ms).
+monitor_bot.py runs it periodically for alerting and failover decisions.
+
+Standalone usage:
+  python synthetic_probe.py --base-url https://sanbao.ai --session-token ...
+  python synthetic_probe.py --standin      # against a local stand-in server
+
+Auth uses `Authorization: Bearer <session token>` like the mobile clients:
+src/proxy.ts bridges it into the session cookie and exempts Bearer requests
+from the CSRF Origin check that rejects cookie-only POSTs.
+
+Every chat step is a real /api/chat request counted against the probe
+user's plan (validate.ts returns 429 at plan.messagesPerDay). Put the probe
+user on a plan with messagesPerDay = 0 (unlimited).
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import aiohttp
+
+DEFAULT_PROMPT = "Ответь одним словом: ok"
+# Steps whose failure says something about the request path (routing, TLS,
+# the server itself). Chat failures are usually the LLM provider or quotas.
+PATH_STEPS = ("page", "api")
+
+
+@dataclass
+class StepResult:
+    """Timings and outcome of one journey step (all times in ms)."""
+
+    name: str
+    ok: bool = False
+    skipped: bool = False
+    status: int | None = None
+    dns_ms: float | None = None
+    connect_ms: float | None = None
+    ttfb_ms: float | None = None
+    first_token_ms: float | None = None
+    total_ms: float | None = None
+    error: str = ""
+
+
+@dataclass
+class JourneyResult:
+    base_url: str
+    started_at: str
+    steps: list[StepResult] = field(default_factory=list)
+    finished_mono: float = field(default_factory=time.monotonic)
+
+    @property
+    def ok(self) -> bool:
+        return all(s.ok or s.skipped for s in self.steps)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(s.total_ms or 0 for s in self.steps)
+
+    @property
+    def path_ok(self) -> bool:
+        """False only if a page/api step hit a connection error or 5xx.
+
+        4xx (expired token, 429 quota) and chat/stream errors are app-level:
+        another server behind the same route would fail the same way.
+        """
+        return not any(
+            s.name in PATH_STEPS and not s.ok and not s.skipped
+            and (s.status is None or s.status >= 500)
+            for s in self.steps
+        )
+
+    @property
+    def failed_step(self) -> StepResult | None:
+        return next((s for s in self.steps if not s.ok and not s.skipped), None)
+
+
+# ── Timing ────────────────────────────────────────────────────────────────
+def _trace_config() -> aiohttp.TraceConfig:
+    """Record DNS and connection timestamps into the request's trace ctx."""
+    tc = aiohttp.TraceConfig()
+
+    def mark(key: str):
+        async def handler(session, ctx, params):
+            ctx.trace_request_ctx[key] = time.perf_counter()
+        return handler
+
+    tc.on_dns_resolvehost_start.append(mark("dns_start"))
+    tc.on_dns_resolvehost_end.append(mark("dns_end"))
+    tc.on_connection_create_start.append(mark("conn_start"))
+    tc.on_connection_create_end.append(mark("conn_end"))
+    return tc
+
+
+def _ms(start: float | None, end: float | None) -> float | None:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 1)
+
+
+async def _run_step(
+    name: str,
+    method: str,
+    url: str,
+    *,
+    headers: dict[str, str],
+    json_body: dict | None = None,
+    stream: bool = False,
+    timeout: float = 30,
+) -> StepResult:
+    """Run one request on a fresh connection so DNS/connect are measured."""
+    step = StepResult(name=name)
+    marks: dict[str, float] = {}
+    t0 = time.perf_counter()
+    try:
+        connector = aiohttp.TCPConnector(force_close=True, use_dns_cache=False)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[_trace_config()],
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as s:
+            async with s.request(
+                method, url, headers=headers, json=json_body, trace_request_ctx=marks,
+            ) as r:
+                step.status = r.status
+                step.ttfb_ms = _ms(t0, time.perf_counter())
+                if not stream:
+                    await r.read()
+                    step.ok = r.status < 400
+                    if not step.ok:
+                        step.error = f"HTTP {r.status}"
+                elif r.status != 200:
+                    step.error = f"HTTP {r.status}: {(await r.text())[:120]}"
+                else:
+                    # NDJSON stream: {"t": type, "v": value} per line.
+                    # "c" = content, "r" = reasoning, "e" = error.
+                    async for raw in r.content:
+                        line = raw.strip()
+                        if not line:
+                            continue
+                        try:
+                            chunk = json.loads(line)
+                        except ValueError:
+                            continue
+                        if chunk.get("t") == "e":
+                            step.error = f"stream error: {str(chunk.get('v'))[:120]}"
+                            break
+                        if chunk.get("t") in ("c", "r") and chunk.get("v") and step.first_token_ms is None:
+                            step.first_token_ms = _ms(t0, time.perf_counter())
+                    if not step.error and step.first_token_ms is None:
+                        step.error = "stream ended without tokens"
+                    step.ok = not step.error
+    except Exception as e:
+        step.error = (str(e) or type(e).__name__)[:120]
+
+    step.total_ms = _ms(t0, time.perf_counter())
+    step.dns_ms = _ms(marks.get("dns_start"), marks.get("dns_end"))
+    conn_ms = _ms(marks.get("conn_start"), marks.get("conn_end"))
+    if conn_ms is not None:
+        # connection_create covers DNS + TCP + TLS; report TCP + TLS only
+        step.connect_ms = round(conn_ms - (step.dns_ms or 0), 1)
+    return step
+
+
+# ── Journey ───────────────────────────────────────────────────────────────
+async def run_journey(
+    base_url: str,
+    session_token: str = "",
+    agent_id: str = "",
+    *,
+    prompt: str = DEFAULT_PROMPT,
+    timeout: float = 30,
+) -> JourneyResult:
+    """Run page → api → chat against base_url, stopping at the first failure.
+
+    Without a session token the authenticated steps are marked skipped.
+    """
+    base_url = base_url.rstrip("/")
+    result = JourneyResult(
+        base_url=base_url,
+        started_at=datetime.now(timezone.utc).isoformat(),
+    )
+    headers = {"User-Agent": "sanbao-synthetic-probe/1.0"}
+
+    page = await _run_step("page", "GET", f"{base_url}/", headers=headers, timeout=timeout)
+    result.steps.append(page)
+
+    auth_headers = {**headers, "Authorization": f"Bearer {session_token}"}
+    for name in ("api", "chat"):
+        if not session_token or not result.ok:
+            result.steps.append(StepResult(
+                name=name, skipped=True,
+                error="no session token" if not session_token else "previous step failed",
+            ))
+            continue
+        if name == "api":
+            step = await _run_step(
+                "api", "GET", f"{base_url}/api/agents",
+                headers=auth_headers, timeout=timeout,
+            )
+        else:
+            body: dict = {
+                "messages": [{"role": "user", "content": prompt}],
+                "thinkingEnabled": False,
+            }
+            if agent_id:
+                body["agentId"] = agent_id
+            step = await _run_step(
+                "chat", "POST", f"{base_url}/api/chat",
+                headers=auth_headers, json_body=body, stream=True, timeout=timeout,
+            )
+        result.steps.append(step)
+
+    result.finished_mono = time.monotonic()
+    return result
+
+
+def format_journey(result: JourneyResult) -> str:
+    """Compact plain-text report, one line per step."""
+
+    def fmt(v: float | None) -> str:
+        return "-" if v is None else f"{v:.0f}"
+
+    lines = [f"{'OK' if result.ok else 'FAIL'} {result.base_url} ({result.total_ms:.0f}ms)"]
+    for s in result.steps:
+        if s.skipped:
+            lines.append(f"  ⏭ {s.name:<5} skipped: {s.error}")
+            continue
+        lines.append(
+            f"  {'✅' if s.ok else '❌'} {s.name:<5} {s.status or '---'} "
+            f"dns {fmt(s.dns_ms)} / conn {fmt(s.connect_ms)} / ttfb {fmt(s.ttfb_ms)} / "
+            f"1st {fmt(s.first_token_ms)} / total {fmt(s.total_ms)} ms"
+        )
+        if s.error:
+            lines.append(f"      {s.error}")
+    return "\n".join(lines)
+
+
+# ── Local stand-in server ─────────────────────────────────────────────────
+def make_standin_app(token_delay: float = 0.05):
+    """Minimal aiohttp app mimicking the three endpoints the journey uses.
+
+    Enforces the same CSRF rule as src/proxy.ts: state-changing requests
+    need either a Bearer token or an allowed Origin.
+    """
+    from aiohttp import web
+
+    @web.middleware
+    async def csrf(request: web.Request, handler):
+        if request.method in ("POST", "PUT", "PATCH", "DELETE"):
+            bearer = request.headers.get("Authorization", "").lower().startswith("bearer ")
+            origin = request.headers.get("Origin")
+            if not bearer and origin != f"{request.scheme}://{request.host}":
+                return web.json_response({"error": "CSRF validation failed: invalid origin"}, status=403)
+        return await handler(request)
+
+    def authed(request: web.Request) -> bool:
+        auth = request.headers.get("Authorization", "")
+        return auth.lower().startswith("bearer ") and len(auth) > len("bearer ")
+
+    async def index(request: web.Request) -> web.Response:
+        return web.Response(text="<html><body>sanbao stand-in</body></html>", content_type="text/html")
+
+    async def agents(request: web.Request) -> web.Response:
+        if not authed(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        return web.json_response([{"id": "probe-agent", "name": "Probe"}])
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        if not authed(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        await request.json()
+        resp = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+        await resp.prepare(request)
+        for word in ("o", "k"):
+            await asyncio.sleep(token_delay)
+            await resp.write((json.dumps({"t": "c", "v": word}) + "\n").encode())
+        await resp.write_eof()
+        return resp
+
+    app = web.Application(middlewares=[csrf])
+    app.router.add_get("/", index)
+    app.router.add_get("/api/agents", agents)
+    app.router.add_post("/api/chat", chat)
+    return app
+
+
+async def _run_standin(args: argparse.Namespace) -> JourneyResult:
+    from aiohttp import web
+
+    runner = web.AppRunner(make_standin_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await run_journey(
+            f"http://127.0.0.1:{port}", args.session_token or "standin",
+            args.agent_id, timeout=args.timeout,
+        )
+    finally:
+        await runner.cleanup()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="https://sanbao.ai")
+    parser.add_argument("--session-token", default="")
+    parser.add_argument("--agent-id", default="")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--standin", action="store_true", help="probe a local stand-in server")
+    args = parser.parse_args()
+
+    if args.standin:
+        result = asyncio.run(_run_standin(args))
+    else:
+        result = asyncio.run(run_journey(
+            args.base_url, args.session_token, args.agent_id,
+            timeout=args.timeout,
+        ))
+    print(format_journey(result))
+    return 0 if result.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,7 @@
 #   1. PostgreSQL (sanbao) — pg_dump compressed + integrity verified
 #   2. LeemaDB data — tar.gz of data directory
 #   3. Deploy configs — .env files and compose
+#   4. Manifest — sha256, sizes, per-table row counts (used by restore drills)
 #
 # Improvements (Feb 2026):
 #   - docker compose exec instead of image-based container discovery
@@ -274,7 +275,52 @@ if [ -n "${CONFIG_FILES}" ]; then
     log "Configs: OK ($(human_size ${CFG_SIZE}))"
 fi
 
-# ── 4. Weekly copy (Sundays) ───────────────────────────────────────────────
+# ── 4. Manifest ─────────────────────────────────────────────────────────────
+# Checksums and expected contents of this backup set. Restore drills in the
+# monitor bot verify a restored instance against it.
+MANIFEST_FILE="${DAILY_DIR}/manifest-${TIMESTAMP}.json"
+log "Writing manifest..."
+
+MANIFEST_PARTS=""
+if [ -f "${PG_FILE}" ]; then
+    # Rows per table counted straight from the dump's COPY blocks — exactly
+    # what a restore of this file has to reproduce.
+    PG_ROWS_JSON=$(gzip -dc "${PG_FILE}" | awk '
+        /^COPY / { tbl = $2; n = 0; incopy = 1; next }
+        incopy && $0 == "\\." { gsub(/"/, "\\\"", tbl); printf "%s\"%s\": %d", sep, tbl, n; sep = ", "; incopy = 0; next }
+        incopy { n++ }
+    ')
+    MANIFEST_PARTS="${MANIFEST_PARTS}
+  \"postgres\": {
+    \"file\": \"$(basename "${PG_FILE}")\",
+    \"bytes\": $(file_size_bytes "${PG_FILE}"),
+    \"sha256\": \"$(sha256sum "${PG_FILE}" | cut -d' ' -f1)\",
+    \"rows\": {${PG_ROWS_JSON}}
+  },"
+fi
+if [ -f "${LDB_FILE}" ]; then
+    # Regular files and their total size inside the archive
+    read -r LDB_FILES LDB_CONTENT_BYTES < <(tar -tzvf "${LDB_FILE}" 2>/dev/null \
+        | awk '$1 ~ /^-/ { n++; b += $3 } END { printf "%d %d\n", n, b }')
+    MANIFEST_PARTS="${MANIFEST_PARTS}
+  \"leemadb\": {
+    \"file\": \"$(basename "${LDB_FILE}")\",
+    \"bytes\": $(file_size_bytes "${LDB_FILE}"),
+    \"sha256\": \"$(sha256sum "${LDB_FILE}" | cut -d' ' -f1)\",
+    \"root\": \"$(basename "${LDB_DATA}")\",
+    \"files\": ${LDB_FILES:-0},
+    \"content_bytes\": ${LDB_CONTENT_BYTES:-0}
+  },"
+fi
+
+if [ -n "${MANIFEST_PARTS}" ]; then
+    printf '{%s\n  "timestamp": "%s"\n}\n' "${MANIFEST_PARTS}" "${TIMESTAMP}" > "${MANIFEST_FILE}"
+    log "Manifest: OK ($(basename "${MANIFEST_FILE}"))"
+else
+    log "Manifest: skipped (no data backups)"
+fi
+
+# ── 5. Weekly copy (Sundays) ───────────────────────────────────────────────
 if [ "${DATE_DOW}" = "7" ]; then
     log "Creating weekly copies (Sunday)..."
     for f in "${DAILY_DIR}"/*-"${TIMESTAMP}".*; do
@@ -283,7 +329,7 @@ if [ "${DATE_DOW}" = "7" ]; then
     log "Weekly copies created."
 fi
 
-# ── 5. Monthly copy (1st of month) ─────────────────────────────────────────
+# ── 6. Monthly copy (1st of month) ─────────────────────────────────────────
 if [ "${DATE_DAY}" = "01" ]; then
     log "Creating monthly copies (1st)..."
     for f in "${DAILY_DIR}"/*-"${TIMESTAMP}".*; do
@@ -292,7 +338,7 @@ if [ "${DATE_DAY}" = "01" ]; then
     log "Monthly copies created."
 fi
 
-# ── 6. Rotation ────────────────────────────────────────────────────────────
+# ── 7. Rotation ────────────────────────────────────────────────────────────
 log "Rotating old backups..."
 
 rotate_dir() {
@@ -304,6 +350,7 @@ rotate_dir() {
         ls -1t "${dir}"/postgres-*.sql.gz | tail -n +$((keep + 1)) | xargs rm -f
         ls -1t "${dir}"/leemadb-*.tar.gz 2>/dev/null | tail -n +$((keep + 1)) | xargs rm -f
         ls -1t "${dir}"/configs-*.tar.gz 2>/dev/null | tail -n +$((keep + 1)) | xargs rm -f
+        ls -1t "${dir}"/manifest-*.json 2>/dev/null | tail -n +$((keep + 1)) | xargs rm -f
         log "Rotated ${dir}: kept ${keep}, removed $((count - keep))"
     fi
 }
@@ -312,7 +359,7 @@ rotate_dir "${DAILY_DIR}" "${KEEP_DAILY}"
 rotate_dir "${WEEKLY_DIR}" "${KEEP_WEEKLY}"
 rotate_dir "${MONTHLY_DIR}" "${KEEP_MONTHLY}"
 
-# ── 7. Summary ──────────────────────────────────────────────────────────────
+# ── 8. Summary ──────────────────────────────────────────────────────────────
 DISK_FREE=$(df -h /backups 2>/dev/null | tail -1 | awk '{print $4}' || echo "?")
 TOTAL_BACKUPS=$(find "${BACKUP_ROOT}" -name "*.gz" 2>/dev/null | wc -l)
 TOTAL_SIZE=$(du -sh "${BACKUP_ROOT}" 2>/dev/null | cut -f1 || echo "?")
@@ -330,6 +377,7 @@ if [ ${ERRORS} -eq 0 ]; then
 ✔ PostgreSQL (gzip verified)
 ✔ LeemaDB (gzip verified)
 ✔ Configs
+✔ Manifest
 EOF
 )"
 else